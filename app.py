@@ -1,13 +1,29 @@
-from fastapi import FastAPI, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import Depends, FastAPI, Header, UploadFile, HTTPException
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import tempfile
+from collections import defaultdict
+from contextlib import AsyncExitStack, asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 import logging
 from transaction_extractor import TransactionExtractor
-from openai import OpenAI
-import json
+from statement_batcher import StatementBatcher
+from pdf_pages import PDF_Y_TOLERANCE, extract_page, extract_pages_from_bytes
+from openai import AsyncOpenAI, BadRequestError
+from diskcache import Cache
+from typing import AsyncIterator, List, Optional, Tuple, Union
+import numpy as np
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import httpx
+import re
+import ijson
+import orjson
 import os
+import threading
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -20,16 +36,122 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# OpenAI client, created on the event loop that uses it (see _get_client) since its
+# connection pool cannot be shared between loops
+client: Optional[AsyncOpenAI] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+OPENAI_MODEL = "gpt-3.5-turbo"
+
+# On-disk cache of OpenAI responses, shared by all workers on the host
+response_cache = Cache(os.getenv('OPENAI_CACHE_DIR', '/tmp/openai_cache'))
+RESPONSE_CACHE_TTL = 24 * 60 * 60  # seconds
+
+# Bound concurrent OpenAI requests per worker so traffic spikes queue here
+# instead of piling up as rate-limit errors and timeouts
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', '10'))
+OPENAI_QUEUE_TIMEOUT = float(os.getenv('OPENAI_QUEUE_TIMEOUT', '30'))  # seconds
+openai_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
+# Statements batched into one request share a reply, which is capped at 4,096 output
+# tokens for gpt-3.5-turbo; at roughly 22 tokens per compact row, a request holds at
+# most this many purchase lines
+OPENAI_BATCH_MAX_LINES = int(os.getenv('OPENAI_BATCH_MAX_LINES', '120'))
+
+class OpenAIBusyError(Exception):
+    """Raised when no OpenAI request slot frees up within OPENAI_QUEUE_TIMEOUT."""
+
+# Semantic cache: reuse a cached response when a statement's embedding is
+# close enough to one the same client analyzed before and it has exactly the same
+# purchase dates and amounts, so only descriptions can differ (e.g. extraction
+# noise). Consecutive monthly statements look alike but never share every date
+# and amount, so they are not served for each other. Each client (identified by
+# the X-Client-Id header) has its own small index, so a lookup only loads that
+# client's vectors. Off by default.
+EMBEDDING_MODEL = "text-embedding-3-small"
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'false').lower() == 'true'
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.95'))
+SEMANTIC_CACHE_MAX_ENTRIES = 100  # per client
+SEMANTIC_INDEX_PREFIX = "semantic_index:v2:"
+
+# Size of the chunks used to read uploads
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+# PDF text extraction backend: "pypdfium2" (fast, default) or "pdfplumber" for
+# statements where pypdfium2 lays out text differently
+PDF_BACKEND = os.getenv('PDF_BACKEND', 'pypdfium2').lower()
+
+# PDFium is not thread-safe, so pypdfium2 calls are serialized across threads
+_pdfium_lock = threading.Lock()
+
+# PDFs with at least this many pages are split across a process pool
+PARALLEL_PAGE_THRESHOLD = 5
+PDF_PAGE_WORKERS = int(os.getenv('PDF_PAGE_WORKERS', str(os.cpu_count() or 1)))
+_page_pool: Optional[ProcessPoolExecutor] = None
+_page_pool_unavailable = False
+_page_pool_lock = threading.Lock()
+
+# Text extracted from PDFs, keyed by the SHA-256 of the PDF content. Statement
+# text is sensitive, so entries expire quickly and the store is size-bounded.
+pdf_text_cache = Cache(os.getenv('PDF_TEXT_CACHE_DIR', '/tmp/pdftext'), size_limit=64 * 1024 * 1024)
+PDF_TEXT_CACHE_TTL = 60 * 60  # seconds
 
 # Get the frontend URL from environment variable, default to localhost for development
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:5173')
 
+def _get_client() -> AsyncOpenAI:
+    """
+    Return the OpenAI client for the running event loop, creating it if needed.
+    
+    The lifespan creates it on startup; creating it here as well covers code that
+    runs without the lifespan, such as scripts and test clients.
+    """
+    global client, _client_loop
+    loop = asyncio.get_running_loop()
+    if client is None or _client_loop is not loop:
+        client = AsyncOpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+            )
+        )
+        _client_loop = loop
+    return client
+
+def _shutdown_page_pool() -> None:
+    """Stop the page extraction pool's worker processes, if it was started."""
+    global _page_pool
+    with _page_pool_lock:
+        pool, _page_pool = _page_pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared resources on startup and release them on shutdown."""
+    global client, _client_loop
+    
+    # Size the default thread pool used for blocking work such as PDF parsing
+    max_workers = min(32, (os.cpu_count() or 1) * 2)
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max_workers))
+    logger.info(f"Default executor configured with {max_workers} workers")
+    
+    _get_client()
+    
+    yield
+    
+    await statement_batcher.stop()
+    await asyncio.to_thread(_shutdown_page_pool)
+    if client is not None:
+        await client.close()
+        client = None
+        _client_loop = None
+
 app = FastAPI(
     title="Expense Categorizer API",
     description="API for processing credit card statements and categorizing expenses",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Configure CORS middleware
@@ -38,68 +160,183 @@ app.add_middleware(
     allow_origins=[
         "http://localhost:5173",  # Local development
         "https://expense-categorizer-2r89.vercel.app",  # Your frontend domain
-        "https://*.vercel.app"    # All Vercel deployments
+        FRONTEND_URL
     ],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-EXPENSE_CATEGORIZATION_PROMPT = """
-You are an expert at analyzing credit card statements and categorizing expenses. 
-Given the following credit card statement text, please:
-
-1. Extract all transactions with their dates, descriptions, and amounts
-2. Categorize each transaction into one of these categories:
-   - Food & Dining
-   - Shopping
-   - Transportation
-   - Entertainment
-   - Utilities
-   - Travel
-   - Health & Medical
-   - Education
-   - Personal Care
-   - Other
-
-Format your response as a JSON array of objects, where each object has these fields:
-    "date": "YYYY-MM-DD",
-    "description": "Transaction description",
-    "amount": float,
-    "category": "Category name"
-
-If you don't know how to categorize a transaction, use "Other". Please don't make up a category 
-or skip any transactions. 
-
-Here is the credit card statement text:
+# Categories are referred to by letter in prompts and responses to save tokens
+CATEGORIES = [
+    "Food & Dining",
+    "Shopping",
+    "Transportation",
+    "Entertainment",
+    "Utilities",
+    "Travel",
+    "Health & Medical",
+    "Education",
+    "Personal Care",
+    "Other",
+]
+CATEGORY_CODES = {chr(ord('A') + i): category for i, category in enumerate(CATEGORIES)}
+CATEGORY_LEGEND = ", ".join(f"{code}={category}" for code, category in CATEGORY_CODES.items())
+FALLBACK_CATEGORY = "Other"
+FALLBACK_CODE = next(code for code, category in CATEGORY_CODES.items() if category == FALLBACK_CATEGORY)
+
+EXPENSE_CATEGORIZATION_PROMPT = """Categorize every credit card purchase below as one of: {category_legend}.
+Reply with JSON {{"t": [["YYYY-MM-DD", "description", amount, "letter"], ...]}}, one entry per purchase, in order.
+Use {fallback_code} if unsure. Never skip a purchase or invent a category.
+
 {statement_text}
 """
 
-def read_pdf(file_path: str) -> str:
-    """Read and extract text from a PDF file using pdfplumber."""
+BATCH_CATEGORIZATION_PROMPT = """Categorize every credit card purchase in each of the {statement_count} numbered statements below as one of: {category_legend}.
+Reply with JSON {{"1": [["YYYY-MM-DD", "description", amount, "letter"], ...], "2": [...], ...}}, keyed by statement number, one entry per purchase, in order.
+Use {fallback_code} if unsure. Never skip a purchase or statement, invent a category, or mix purchases between statements.
+
+{statements}
+"""
+
+# Purchase lines start with an MM/DD date; anything else is headers and page furniture
+PURCHASE_LINE_RE = re.compile(r"^\d{2}/\d{2}\s")
+# A complete purchase line ends with its amount
+PURCHASE_AMOUNT_RE = re.compile(r"-?\$?[\d,]*\d\.\d{2}$")
+
+SYSTEM_PROMPT = "You are a financial statement analyzer that returns only valid JSON."
+
+def _get_page_pool() -> Optional[ProcessPoolExecutor]:
+    """Return the shared page extraction pool, or None if processes are unavailable."""
+    global _page_pool, _page_pool_unavailable
+    with _page_pool_lock:
+        if _page_pool is None and not _page_pool_unavailable:
+            try:
+                # Spawn rather than fork: forking a multi-threaded server process can
+                # copy a lock (e.g. logging's) in its held state and deadlock the child
+                _page_pool = ProcessPoolExecutor(
+                    max_workers=PDF_PAGE_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            except (OSError, NotImplementedError) as e:
+                # Some serverless runtimes lack the semaphores multiprocessing needs
+                logger.warning(f"Process pool unavailable, extracting pages serially: {str(e)}")
+                _page_pool_unavailable = True
+        return _page_pool
+
+def _discard_page_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a broken page extraction pool so the next PDF gets a fresh one."""
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is pool:
+            _page_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _read_pages_pdfplumber(pdf_bytes: bytes) -> List[Optional[str]]:
+    """Extract text from every page with pdfplumber, in page order."""
+    import pdfplumber
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        page_count = len(pdf.pages)
+        pool = _get_page_pool() if page_count >= PARALLEL_PAGE_THRESHOLD else None
+        if pool is None:
+            return [extract_page(page, page_num) for page_num, page in enumerate(pdf.pages, 1)]
+    
+    # Each worker opens its own copy of the PDF and extracts a contiguous run of
+    # pages, so the bytes are sent once per worker rather than once per page
+    worker_count = min(PDF_PAGE_WORKERS, page_count)
+    all_page_nums = list(range(1, page_count + 1))
+    page_runs = [
+        all_page_nums[i * page_count // worker_count:(i + 1) * page_count // worker_count]
+        for i in range(worker_count)
+    ]
     try:
-        import pdfplumber
-        pdf_path = Path(file_path).resolve()
-        
-        if not pdf_path.exists():
-            raise FileNotFoundError(f"PDF file not found at: {pdf_path}")
-            
-        if pdf_path.suffix.lower() != '.pdf':
-            raise ValueError(f"File must be a PDF. Got: {pdf_path.suffix}")
-        
-        logger.info(f"Reading PDF from: {pdf_path}")
-        
-        text = ""
-        with pdfplumber.open(pdf_path) as pdf:
-            for page_num, page in enumerate(pdf.pages, 1):
+        page_texts = []
+        for run_texts in pool.map(extract_pages_from_bytes, [pdf_bytes] * worker_count, page_runs):
+            page_texts.extend(run_texts)
+        return page_texts
+    except BrokenProcessPool as e:
+        # A worker died (e.g. killed for memory); replace the pool next time
+        logger.error(f"Page extraction pool is broken, extracting pages serially: {str(e)}")
+        _discard_page_pool(pool)
+    
+    return extract_pages_from_bytes(pdf_bytes, all_page_nums)
+
+def _pdfium_page_text(textpage) -> str:
+    """
+    Rebuild a page's text one visual row per line, like pdfplumber does.
+    
+    PDFium returns text in content-stream order, so a statement drawn column by
+    column would come out as one line per column. Instead, take each text run's
+    bounding box, group runs whose baselines are within PDF_Y_TOLERANCE into a
+    row, and join each row's runs left to right.
+    """
+    segments = []
+    for i in range(textpage.count_rects()):
+        left, bottom, right, top = textpage.get_rect(i)
+        text = textpage.get_text_bounded(left, bottom, right, top).strip()
+        if text:
+            segments.append((bottom, left, text))
+    
+    # PDF y coordinates grow upwards, so the top of the page has the largest bottom
+    segments.sort(key=lambda segment: (-segment[0], segment[1]))
+    rows = []
+    row_bottom = None
+    for bottom, left, text in segments:
+        if row_bottom is None or row_bottom - bottom > PDF_Y_TOLERANCE:
+            rows.append([])
+            row_bottom = bottom
+        rows[-1].append((left, text))
+    
+    return "\n".join(" ".join(text for _, text in sorted(row)) for row in rows)
+
+def _read_pages_pypdfium2(pdf_bytes: bytes) -> List[Optional[str]]:
+    """Extract text from every page with pypdfium2, in page order."""
+    import pypdfium2
+    page_texts = []
+    with _pdfium_lock:
+        pdf = pypdfium2.PdfDocument(pdf_bytes)
+        try:
+            for page_num, page in enumerate(pdf, 1):
                 try:
-                    page_text = page.extract_text()
+                    textpage = page.get_textpage()
+                    page_text = _pdfium_page_text(textpage)
+                    textpage.close()
                     if not page_text:
                         logger.warning(f"No text extracted from page {page_num}")
-                    text += page_text + "\n"
+                    page_texts.append(page_text)
                 except Exception as e:
                     logger.error(f"Error processing page {page_num}: {str(e)}")
-                    continue
+                    page_texts.append(None)
+                finally:
+                    page.close()
+        finally:
+            pdf.close()
+    return page_texts
+
+def read_pdf(source: Union[str, bytes]) -> str:
+    """Read and extract text from a PDF file path or PDF bytes using the configured PDF_BACKEND."""
+    try:
+        if isinstance(source, bytes):
+            pdf_bytes = source
+            logger.info(f"Reading {len(pdf_bytes)}-byte PDF with {PDF_BACKEND}")
+        else:
+            pdf_path = Path(source).resolve()
+            
+            if not pdf_path.exists():
+                raise FileNotFoundError(f"PDF file not found at: {pdf_path}")
+                
+            if pdf_path.suffix.lower() != '.pdf':
+                raise ValueError(f"File must be a PDF. Got: {pdf_path.suffix}")
+            
+            logger.info(f"Reading PDF from: {pdf_path} with {PDF_BACKEND}")
+            pdf_bytes = pdf_path.read_bytes()
+        
+        if PDF_BACKEND == 'pdfplumber':
+            page_texts = _read_pages_pdfplumber(pdf_bytes)
+        else:
+            page_texts = _read_pages_pypdfium2(pdf_bytes)
+        
+        text = "\n".join(page_text for page_text in page_texts if page_text is not None) + "\n"
         
         if not text.strip():
             logger.error("No text was extracted from the PDF")
@@ -112,45 +349,431 @@ def read_pdf(file_path: str) -> str:
         logger.error(f"Error reading PDF: {str(e)}")
         raise
 
-def analyze_with_openai(text: str) -> dict:
-    """Send the PDF text to OpenAI API for analysis and categorization."""
+def read_pdf_cached(pdf_bytes: bytes, pdf_hash: str) -> str:
+    """Read text from a PDF, reusing the text extracted from an identical PDF if available."""
+    cache_key = f"{pdf_hash}:{PDF_BACKEND}"
+    text = pdf_text_cache.get(cache_key)
+    if text is not None:
+        logger.info(f"PDF text cache hit: {pdf_hash[:12]}")
+        return text
+    logger.info(f"PDF text cache miss: {pdf_hash[:12]}")
+    
+    text = read_pdf(pdf_bytes)
+    pdf_text_cache.set(cache_key, text, expire=PDF_TEXT_CACHE_TTL)
+    return text
+
+def _response_cache_key(model: str, prompt: str) -> str:
+    """Build the response cache key for a (model, prompt) pair."""
+    return hashlib.sha256(f"{model}|{prompt}".encode()).hexdigest()
+
+async def _embed(text: str) -> np.ndarray:
+    """Embed text with OpenAI and return the L2-normalized vector."""
+    response = await _get_client().embeddings.create(model=EMBEDDING_MODEL, input=text)
+    vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def _semantic_index_key(client_id: str) -> str:
+    """Build the cache key of a client's semantic index."""
+    return SEMANTIC_INDEX_PREFIX + hashlib.sha256(client_id.encode()).hexdigest()
+
+def _purchases(text: str) -> List[Tuple[str, str]]:
+    """Return the (MM/DD date, amount) of each complete purchase line in the statement text."""
+    purchases = []
+    for line in _compact_purchases(text).splitlines():
+        amount = PURCHASE_AMOUNT_RE.search(line)
+        if PURCHASE_LINE_RE.match(line) and amount:
+            purchases.append((line[:5], amount.group(0)))
+    return purchases
+
+def _purchase_fingerprint(text: str) -> Optional[str]:
+    """Hash the dates and amounts of a statement's purchase lines, or None if there are none."""
+    pairs = [f"{date} {amount}" for date, amount in _purchases(text)]
+    if not pairs:
+        return None
+    return hashlib.sha256("\n".join(sorted(pairs)).encode()).hexdigest()
+
+def _semantic_lookup(vector: np.ndarray, fingerprint: str, client_id: str) -> Optional[str]:
+    """Return the cached response of the client's most similar statement with the same purchases."""
+    index = response_cache.get(_semantic_index_key(client_id))
+    if index is None:
+        return None
+    
+    embeddings, cache_keys, fingerprints = index
+    candidates = [i for i, candidate in enumerate(fingerprints) if candidate == fingerprint]
+    if not candidates:
+        return None
+    similarities = embeddings[candidates] @ vector
+    best = int(np.argmax(similarities))
+    if similarities[best] < SEMANTIC_CACHE_THRESHOLD:
+        return None
+    
+    cache_key = cache_keys[candidates[best]]
+    logger.info(f"Semantic cache candidate {cache_key[:12]} (similarity {similarities[best]:.4f})")
+    # The response itself may have expired since it was indexed
+    return response_cache.get(cache_key)
+
+def _semantic_add(vector: np.ndarray, fingerprint: str, cache_key: str, client_id: str) -> None:
+    """Add a statement embedding to the client's semantic index."""
+    index_key = _semantic_index_key(client_id)
+    with response_cache.transact():
+        embeddings, cache_keys, fingerprints = response_cache.get(
+            index_key,
+            (np.empty((0, vector.size), dtype=np.float32), [], [])
+        )
+        embeddings = np.vstack([embeddings, vector])[-SEMANTIC_CACHE_MAX_ENTRIES:]
+        cache_keys = (cache_keys + [cache_key])[-SEMANTIC_CACHE_MAX_ENTRIES:]
+        fingerprints = (fingerprints + [fingerprint])[-SEMANTIC_CACHE_MAX_ENTRIES:]
+        response_cache.set(index_key, (embeddings, cache_keys, fingerprints), expire=RESPONSE_CACHE_TTL)
+
+def _compact_purchases(text: str) -> str:
+    """
+    Keep only the purchase lines of the statement text, if any can be found.
+    
+    A long description can wrap so that the amount lands on a following line
+    without a date. Lines are joined onto a purchase only until it ends with an
+    amount; any other undated line is headers and page furniture and is dropped.
+    """
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if PURCHASE_LINE_RE.match(line):
+            lines.append(line)
+        elif line and lines and not PURCHASE_AMOUNT_RE.search(lines[-1]):
+            lines[-1] += " " + line
+    return "\n".join(lines) if lines else text
+
+def _categorization_prompt(text: str) -> str:
+    """Build the categorization prompt for a single statement."""
+    return EXPENSE_CATEGORIZATION_PROMPT.format(
+        category_legend=CATEGORY_LEGEND,
+        fallback_code=FALLBACK_CODE,
+        statement_text=_compact_purchases(text)
+    )
+
+def _expand_transaction(row: list) -> dict:
+    """Expand a compact [date, description, amount, letter] row into a transaction."""
+    if not isinstance(row, list) or len(row) != 4:
+        raise ValueError(f"Malformed transaction row in OpenAI response: {row!r}")
+    date, description, amount, code = row
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        raise ValueError(f"Malformed amount in OpenAI response: {amount!r}")
+    return {
+        "date": date,
+        "description": description,
+        "amount": amount,
+        "category": CATEGORY_CODES.get(code, FALLBACK_CATEGORY)
+    }
+
+def _expand_transactions(rows: list) -> dict:
+    """Expand one statement's compact rows into a result with a transactions list."""
+    if not isinstance(rows, list):
+        raise ValueError("OpenAI response is missing the statement's transactions")
+    return {"transactions": [_expand_transaction(row) for row in rows]}
+
+def _completion_params(prompt: str) -> dict:
+    """Build the chat completion parameters for a categorization prompt."""
+    return {
+        "model": OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.1,
+        "response_format": {"type": "json_object"}
+    }
+
+@asynccontextmanager
+async def _openai_slot() -> AsyncIterator[None]:
+    """Wait for one of the OPENAI_MAX_CONCURRENCY slots for an OpenAI request."""
+    try:
+        await asyncio.wait_for(openai_semaphore.acquire(), OPENAI_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise OpenAIBusyError("Too many statements are being analyzed, please try again shortly")
+    try:
+        yield
+    finally:
+        openai_semaphore.release()
+
+async def _complete(prompt: str) -> str:
+    """Run a single chat completion and return the message content."""
+    async with _openai_slot():
+        response = await _get_client().chat.completions.create(**_completion_params(prompt))
+    choice = response.choices[0]
+    if choice.finish_reason == "length":
+        raise ValueError("OpenAI response was truncated at the output token limit")
+    return choice.message.content
+
+async def _categorize_one(text: str) -> dict:
+    """Categorize a single statement with its own OpenAI request."""
+    response = orjson.loads(await _complete(_categorization_prompt(text)))
+    if not isinstance(response, dict):
+        raise ValueError("OpenAI response is not a JSON object")
+    return _expand_transactions(response.get('t'))
+
+def _amounts_match(result: dict, text: str) -> bool:
+    """Check that a result has exactly the amounts of the statement's purchase lines."""
+    # Compare magnitudes; the model may drop or add the sign of a credit
+    expected = sorted(abs(float(amount.replace(',', '').replace('$', ''))) for _, amount in _purchases(text))
+    actual = sorted(abs(transaction['amount']) for transaction in result['transactions'])
+    return len(expected) == len(actual) and all(round(e - a, 2) == 0 for e, a in zip(expected, actual))
+
+def _batch_groups(texts: List[str]) -> List[List[int]]:
+    """
+    Split statements into groups of indices that each fit in one OpenAI request.
+    
+    A group holds at most OPENAI_BATCH_MAX_LINES purchase lines so the reply fits in
+    the output token limit. Statements without recognizable purchase lines can't be
+    checked against a batched reply (see _categorize_group), so they go alone.
+    """
+    groups = []
+    group_lines = 0
+    for i, text in enumerate(texts):
+        line_count = len(_purchases(text))
+        if line_count == 0 or line_count >= OPENAI_BATCH_MAX_LINES:
+            groups.append([i])
+            group_lines = OPENAI_BATCH_MAX_LINES
+            continue
+        if not groups or group_lines + line_count > OPENAI_BATCH_MAX_LINES:
+            groups.append([])
+            group_lines = 0
+        groups[-1].append(i)
+        group_lines += line_count
+    return groups
+
+async def _categorize_group(texts: List[str]) -> List[Union[dict, Exception]]:
+    """
+    Categorize one or more statements with a single OpenAI request.
+    
+    A batch can mix statements from different clients, so a misnumbered reply could
+    hand one client another's transactions (and cache them). Each statement's part
+    of the reply must therefore have exactly that statement's purchase amounts.
+    A statement whose part is unusable or fails that check is retried on its own; if
+    that also fails, its exception is returned in its place so other statements
+    still succeed.
+    """
+    if len(texts) == 1:
+        return await asyncio.gather(_categorize_one(texts[0]), return_exceptions=True)
+    
+    statements = "\n\n".join(f"{i}. {_compact_purchases(text)}" for i, text in enumerate(texts, 1))
+    prompt = BATCH_CATEGORIZATION_PROMPT.format(
+        statement_count=len(texts),
+        category_legend=CATEGORY_LEGEND,
+        fallback_code=FALLBACK_CODE,
+        statements=statements
+    )
+    try:
+        batch_result = orjson.loads(await _complete(prompt))
+        if not isinstance(batch_result, dict):
+            raise ValueError("batched response is not a JSON object")
+    except (ValueError, BadRequestError) as e:
+        # A truncated or malformed response (orjson.JSONDecodeError is a ValueError),
+        # or a request OpenAI rejected, e.g. for exceeding the context window;
+        # fall back to one request per statement
+        logger.warning(f"Batched request failed, retrying individually: {str(e)}")
+        return await asyncio.gather(*(_categorize_one(text) for text in texts), return_exceptions=True)
+    
+    results: List[Union[dict, Exception, None]] = [None] * len(texts)
+    retry = []
+    for i, text in enumerate(texts):
+        try:
+            results[i] = _expand_transactions(batch_result.get(str(i + 1)))
+            if not _amounts_match(results[i], text):
+                raise ValueError("amounts do not match the statement's purchases")
+        except ValueError as e:
+            logger.warning(f"Statement {i + 1} unusable in batched response, retrying individually: {str(e)}")
+            retry.append(i)
+    
+    retried = await asyncio.gather(*(_categorize_one(texts[i]) for i in retry), return_exceptions=True)
+    for i, result in zip(retry, retried):
+        results[i] = result
+    return results
+
+async def _categorize_batch(texts: List[str]) -> List[Union[dict, Exception]]:
+    """Categorize the statements of a batch, one OpenAI request per group that fits."""
+    groups = _batch_groups(texts)
+    group_results = await asyncio.gather(
+        *(_categorize_group([texts[i] for i in group]) for group in groups),
+        return_exceptions=True
+    )
+    
+    results: List[Union[dict, Exception, None]] = [None] * len(texts)
+    for group, group_result in zip(groups, group_results):
+        for position, i in enumerate(group):
+            # A group that failed outright (e.g. no OpenAI slot) fails only its own statements
+            results[i] = group_result if isinstance(group_result, BaseException) else group_result[position]
+    return results
+
+statement_batcher = StatementBatcher(
+    _categorize_batch,
+    max_batch_size=int(os.getenv('OPENAI_BATCH_SIZE', '8')),
+    max_wait=int(os.getenv('OPENAI_BATCH_WAIT_MS', '50')) / 1000
+)
+
+async def analyze_with_openai(text: str, client_id: Optional[str] = None) -> dict:
+    """
+    Send the PDF text to OpenAI API for analysis and categorization.
+    
+    Args:
+        text (str): The purchases text to categorize
+        client_id (Optional[str]): Identifies the caller for the semantic cache; the
+            semantic cache is skipped without one
+    """
     if not os.getenv('OPENAI_API_KEY'):
         raise ValueError("OPENAI_API_KEY environment variable is not set")
     
+    prompt = _categorization_prompt(text)
+    cache_key = _response_cache_key(OPENAI_MODEL, prompt)
+    
+    # diskcache reads and writes hit SQLite, so they run off the event loop
+    cached = await asyncio.to_thread(response_cache.get, cache_key)
+    if cached is not None:
+        logger.info(f"OpenAI response cache hit: {cache_key[:12]}")
+        return orjson.loads(cached)
+    logger.info(f"OpenAI response cache miss: {cache_key[:12]}")
+    
     try:
-        logger.info("Sending text to OpenAI API for analysis")
+        vector = None
+        fingerprint = _purchase_fingerprint(text) if SEMANTIC_CACHE_ENABLED and client_id else None
+        if fingerprint is not None:
+            try:
+                async with _openai_slot():
+                    vector = await _embed(text)
+            except OpenAIBusyError:
+                raise
+            except Exception as e:
+                # e.g. the statement is over the embedding model's token limit
+                logger.warning(f"Could not embed statement, skipping semantic cache: {str(e)}")
         
-        prompt = EXPENSE_CATEGORIZATION_PROMPT.format(statement_text=text)
+        if vector is not None:
+            cached = await asyncio.to_thread(_semantic_lookup, vector, fingerprint, client_id)
+            if cached is not None:
+                logger.info("Semantic cache hit")
+                return orjson.loads(cached)
+            logger.info("Semantic cache miss")
         
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a financial statement analyzer that returns only valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1,
-            response_format={"type": "json_object"}
-        )
+        logger.info("Sending text to OpenAI API for analysis")
         
-        result = json.loads(response.choices[0].message.content)
+        result = await statement_batcher.submit(text)
         logger.info("Successfully received response from OpenAI API")
         
+        await asyncio.to_thread(response_cache.set, cache_key, orjson.dumps(result), expire=RESPONSE_CACHE_TTL)
+        if vector is not None:
+            await asyncio.to_thread(_semantic_add, vector, fingerprint, cache_key, client_id)
         return result
         
     except Exception as e:
         logger.error(f"Error calling OpenAI API: {str(e)}")
         raise
 
+async def _iter_cached_transactions(transactions: List[dict]) -> AsyncIterator[dict]:
+    """Yield transactions from a cached response."""
+    for transaction in transactions:
+        yield transaction
+
+async def _iter_streamed_transactions(stream, cleanup: AsyncExitStack, cache_key: str) -> AsyncIterator[dict]:
+    """
+    Yield categorized transactions from an OpenAI stream as they are generated.
+    
+    cleanup closes the stream and releases its OpenAI slot; it runs when the
+    iterator finishes, fails, or is closed early because the client went away.
+    """
+    async with cleanup:
+        # Parse transactions out of the partial JSON document as chunks arrive
+        rows = ijson.sendable_list()
+        parser = ijson.items_coro(rows, 't.item', use_float=True)
+        content = []
+        transactions = []
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            content.append(delta)
+            parser.send(delta.encode())
+            for row in rows:
+                transactions.append(_expand_transaction(row))
+                yield transactions[-1]
+            del rows[:]
+        parser.close()
+        for row in rows:
+            transactions.append(_expand_transaction(row))
+            yield transactions[-1]
+    logger.info("Successfully streamed response from OpenAI API")
+    
+    # Only cache the response if it is a complete JSON document
+    orjson.loads("".join(content))
+    await asyncio.to_thread(
+        response_cache.set, cache_key, orjson.dumps({"transactions": transactions}), expire=RESPONSE_CACHE_TTL
+    )
+
+async def stream_transactions_with_openai(text: str) -> AsyncIterator[dict]:
+    """
+    Send the PDF text to OpenAI API and return an iterator of categorized transactions.
+    
+    The OpenAI slot is acquired and the request started before this returns, so
+    OpenAIBusyError and request errors are raised here rather than mid-stream.
+    """
+    if not os.getenv('OPENAI_API_KEY'):
+        raise ValueError("OPENAI_API_KEY environment variable is not set")
+    
+    prompt = _categorization_prompt(text)
+    cache_key = _response_cache_key(OPENAI_MODEL, prompt)
+    
+    cached = await asyncio.to_thread(response_cache.get, cache_key)
+    if cached is not None:
+        logger.info(f"OpenAI response cache hit: {cache_key[:12]}")
+        return _iter_cached_transactions(orjson.loads(cached)['transactions'])
+    logger.info(f"OpenAI response cache miss: {cache_key[:12]}")
+    
+    logger.info("Streaming text to OpenAI API for analysis")
+    # Hold a slot for the whole stream; the OpenAI request is open until it ends
+    async with AsyncExitStack() as stack:
+        await stack.enter_async_context(_openai_slot())
+        stream = await _get_client().chat.completions.create(stream=True, **_completion_params(prompt))
+        stack.push_async_callback(stream.close)
+        cleanup = stack.pop_all()
+    return _iter_streamed_transactions(stream, cleanup, cache_key)
+
+async def _extract_purchases_from_upload(file: UploadFile, transaction_extractor: TransactionExtractor) -> str:
+    """Read an uploaded statement PDF into memory and extract its purchases text."""
+    # Read the upload in chunks, hashing as we go, and join them once at the end
+    # into the immutable bytes both PDF backends accept without another copy
+    pdf_hash = hashlib.sha256()
+    chunks = []
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        pdf_hash.update(chunk)
+        chunks.append(chunk)
+    pdf_bytes = b"".join(chunks)
+    
+    # Process the PDF off the event loop; parsing is CPU-bound and slow
+    text = await asyncio.to_thread(read_pdf_cached, pdf_bytes, pdf_hash.hexdigest())
+    return await asyncio.to_thread(transaction_extractor.extract_purchases, text)
+
+# TransactionExtractor holds no per-request state, so one instance serves all requests
+_transaction_extractor = TransactionExtractor()
+
+def get_transaction_extractor() -> TransactionExtractor:
+    """Provide the shared TransactionExtractor."""
+    return _transaction_extractor
+
 @app.post("/analyze-statement")
-async def analyze_statement(file: UploadFile):
+async def analyze_statement(
+    file: UploadFile,
+    transaction_extractor: TransactionExtractor = Depends(get_transaction_extractor),
+    x_client_id: Optional[str] = Header(None)
+):
     """
     Analyze a credit card statement PDF and return categorized expenses.
     
     Args:
         file (UploadFile): The PDF file to analyze
+        transaction_extractor (TransactionExtractor): The extractor used to find purchases
+        x_client_id (Optional[str]): Random per-browser identifier that scopes the semantic
+            cache. It is chosen by the client and not authenticated.
         
     Returns:
-        JSONResponse: A JSON object containing:
+        ORJSONResponse: A JSON object containing:
             - transactions: List of categorized transactions
             - spend_by_category: Dictionary of total spend by category
             - error: Error message if something went wrong
@@ -159,41 +782,75 @@ async def analyze_statement(file: UploadFile):
         raise HTTPException(status_code=400, detail="File must be a PDF")
     
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_path = Path(temp_file.name)
+        purchases = await _extract_purchases_from_upload(file, transaction_extractor)
         
-        try:
-            # Process the PDF
-            text = read_pdf(str(temp_path))
-            transaction_extractor = TransactionExtractor()
-            purchases = transaction_extractor.extract_purchases(text)
-            
-            # Analyze with OpenAI
-            result = analyze_with_openai(purchases)
-            
-            # Calculate spend by category
-            spend_by_category = {}
-            for purchase in result['transactions']:
-                category = purchase['category']
-                amount = purchase['amount']
-                spend_by_category[category] = spend_by_category.get(category, 0) + amount
-            
-            return JSONResponse({
-                "transactions": result['transactions'],
-                "spend_by_category": spend_by_category
-            })
-            
-        finally:
-            # Clean up temporary file
-            temp_path.unlink()
+        # Analyze with OpenAI
+        result = await analyze_with_openai(purchases, client_id=x_client_id)
+        
+        # Calculate spend by category
+        spend_by_category = defaultdict(float)
+        for purchase in result['transactions']:
+            spend_by_category[purchase['category']] += purchase['amount']
+        
+        return ORJSONResponse({
+            "transactions": result['transactions'],
+            "spend_by_category": dict(spend_by_category)
+        })
             
+    except OpenAIBusyError as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error processing PDF: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/analyze-statement/stream")
+async def analyze_statement_stream(
+    file: UploadFile,
+    transaction_extractor: TransactionExtractor = Depends(get_transaction_extractor)
+):
+    """
+    Analyze a credit card statement PDF, streaming categorized expenses as they are produced.
+    
+    Args:
+        file (UploadFile): The PDF file to analyze
+        transaction_extractor (TransactionExtractor): The extractor used to find purchases
+        
+    Returns:
+        StreamingResponse: Newline-delimited JSON, one object per line:
+            - {"transaction": {...}} for each categorized transaction
+            - {"spend_by_category": {...}} once all transactions have been sent
+            - {"error": "..."} if something went wrong after streaming started
+    """
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="File must be a PDF")
+    
+    try:
+        purchases = await _extract_purchases_from_upload(file, transaction_extractor)
+        transactions = await stream_transactions_with_openai(purchases)
+    except OpenAIBusyError as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error processing PDF: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def generate() -> AsyncIterator[bytes]:
+        spend_by_category = defaultdict(float)
+        try:
+            async for transaction in transactions:
+                spend_by_category[transaction['category']] += transaction['amount']
+                yield orjson.dumps({"transaction": transaction}) + b"\n"
+            yield orjson.dumps({"spend_by_category": dict(spend_by_category)}) + b"\n"
+        except Exception as e:
+            logger.error(f"Error streaming analysis: {str(e)}")
+            yield orjson.dumps({"error": str(e)}) + b"\n"
+        finally:
+            # Closes the OpenAI stream and frees its slot if the client disconnected
+            await transactions.aclose()
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
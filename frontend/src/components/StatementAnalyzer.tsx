@@ -56,6 +56,7 @@ export const StatementAnalyzer = () => {
                 {
                     headers: {
                         'Content-Type': 'multipart/form-data',
+                        'X-Client-Id': config.clientId,
                     },
                 }
             );
@@ -1,5 +1,23 @@
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+const CLIENT_ID_KEY = 'expense-categorizer-client-id';
+
+// Random per-browser id sent as X-Client-Id so the API's semantic cache only
+// matches statements uploaded from this browser
+const getClientId = (): string => {
+    try {
+        let clientId = localStorage.getItem(CLIENT_ID_KEY);
+        if (!clientId) {
+            clientId = crypto.randomUUID();
+            localStorage.setItem(CLIENT_ID_KEY, clientId);
+        }
+        return clientId;
+    } catch {
+        // Storage is unavailable (e.g. blocked cookies); use an id for this page load only
+        return crypto.randomUUID();
+    }
+};
 
 export const config = {
     apiUrl: API_URL,
-} as const; 
\ No newline at end of file
+    clientId: getClientId(),
+} as const; 
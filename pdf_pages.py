@@ -0,0 +1,44 @@
+import io
+import logging
+import os
+import time
+from typing import List, Optional
+
+import pdfplumber
+
+# This module runs in the page extraction worker processes, which import it on
+# spawn. Keep it free of server setup (clients, caches, the app) so workers start fast.
+
+logger = logging.getLogger(__name__)
+
+# pdfplumber text extraction settings. Layout analysis (laparams) is left disabled since
+# it is the slowest part of pdfminer and is not needed for line-oriented statements.
+PDF_X_TOLERANCE = 3
+PDF_Y_TOLERANCE = 3
+MAX_PAGE_CHARS = int(os.getenv('MAX_PAGE_CHARS', '100000'))
+SLOW_PAGE_SECONDS = 5
+
+def extract_page(page, page_num: int) -> Optional[str]:
+    """Extract text from a single pdfplumber page, or None if the page is skipped."""
+    try:
+        # Bail out of pathological pages before grouping their characters
+        if len(page.chars) > MAX_PAGE_CHARS:
+            logger.warning(f"Skipping page {page_num}: {len(page.chars)} characters exceeds {MAX_PAGE_CHARS}")
+            return None
+
+        started = time.monotonic()
+        page_text = page.extract_text(x_tolerance=PDF_X_TOLERANCE, y_tolerance=PDF_Y_TOLERANCE)
+        elapsed = time.monotonic() - started
+        if elapsed > SLOW_PAGE_SECONDS:
+            logger.warning(f"Page {page_num} took {elapsed:.1f}s to extract")
+        if not page_text:
+            logger.warning(f"No text extracted from page {page_num}")
+        return page_text or ""
+    except Exception as e:
+        logger.error(f"Error processing page {page_num}: {str(e)}")
+        return None
+
+def extract_pages_from_bytes(pdf_bytes: bytes, page_nums: List[int]) -> List[Optional[str]]:
+    """Open a PDF from bytes and extract text from the given pages. Runs in a worker process."""
+    with pdfplumber.open(io.BytesIO(pdf_bytes), pages=page_nums) as pdf:
+        return [extract_page(page, page_num) for page_num, page in zip(page_nums, pdf.pages)]
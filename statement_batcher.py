@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+class StatementBatcher:
+    """
+    Collects statements submitted close together and processes them as a single batch.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[str]], Awaitable[List[Union[dict, BaseException]]]],
+        max_batch_size: int = 8,
+        max_wait: float = 0.05
+    ):
+        """
+        Initialize the StatementBatcher.
+
+        Args:
+            process_batch (Callable): Coroutine function that takes a list of statements
+                and returns one result per statement, in the same order. A result may be
+                an exception, which is raised only to that statement's submitter; an
+                exception raised by process_batch itself fails the whole batch.
+            max_batch_size (int): The maximum number of statements sent in one batch
+            max_wait (float): Seconds to wait for more statements after the first one arrives
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        """Start the background consumer on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._consumer = asyncio.create_task(self._consume())
+
+    async def stop(self) -> None:
+        """
+        Stop the background consumer and wait for batches already dispatched.
+
+        Statements still waiting in the queue are failed with CancelledError.
+        The batcher starts again on the next submit.
+        """
+        if self._consumer is not None:
+            self._consumer.cancel()
+            try:
+                await self._consumer
+            except asyncio.CancelledError:
+                pass
+            self._consumer = None
+
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            future.cancel()
+
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    async def submit(self, statement: str) -> dict:
+        """
+        Queue a statement and wait for its result.
+
+        Args:
+            statement (str): The statement text to process
+
+        Returns:
+            dict: The result for this statement
+        """
+        if self._consumer is None or self._consumer.done():
+            self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((statement, future))
+        return await future
+
+    async def _consume(self) -> None:
+        """Drain the queue into batches and dispatch each batch without waiting for it."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            try:
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # Stopped while collecting; don't leave these submitters waiting
+                for _, future in batch:
+                    future.cancel()
+                raise
+
+            task = asyncio.create_task(self._dispatch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        """Process one batch and resolve the futures of its submitters."""
+        logger.info(f"Dispatching batch of {len(batch)} statement(s)")
+        try:
+            results = await self.process_batch([statement for statement, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
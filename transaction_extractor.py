@@ -4,9 +4,15 @@ import pdfplumber
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum, auto
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=None)
+def _format_marker(marker: str) -> str:
+    """Duplicate every character of a marker except spaces, as they appear in the PDF."""
+    return "".join(char if char == " " else char * 2 for char in marker)
+
 class TransactionType(Enum):
     """Enum for different types of transactions."""
     PURCHASE = auto()
@@ -50,13 +56,7 @@ class TransactionExtractor:
         Format the start marker to match the PDF's formatting.
         In the PDF, each character appears to be duplicated except spaces.
         """
-        formatted_marker = ""
-        for char in self.start_marker:
-            if char != " ":
-                formatted_marker += char * 2
-            else:
-                formatted_marker += char
-        self.formatted_start_marker = formatted_marker
+        self.formatted_start_marker = _format_marker(self.start_marker)
     
     def extract_transactions(self, text: str) -> str:
         """
@@ -73,19 +73,19 @@ class TransactionExtractor:
         """
         # Find the position of the formatted title in the text
         title_pos = text.find(self.formatted_start_marker)
+        if title_pos == -1:
+            # PDF readers that drop the overlapping glyphs keep the marker as-is
+            title_pos = text.find(self.start_marker)
         if title_pos == -1:
             raise ValueError("Could not find start marker in text")
         
-        # Get text after start point
-        text_after_start = text[title_pos:]
-        
-        # Find the stop point
-        stop_pos = text_after_start.find(self.stop_marker)
+        # Find the stop point, searching in place from the start point
+        stop_pos = text.find(self.stop_marker, title_pos)
         if stop_pos == -1:
             raise ValueError("Could not find stop marker in text")
         
         # Extract text between start and stop points
-        extracted_text = text_after_start[:stop_pos].strip()
+        extracted_text = text[title_pos:stop_pos].strip()
         
         return extracted_text 
 
@@ -110,50 +110,4 @@ class TransactionExtractor:
         
         all_purchases_text = all_transactions[title_pos:]
         
-        # Split text into lines and filter out empty lines
-        # lines = [line.strip() for line in all_purchases_text.split('\n') if line.strip()]
-        
-        # transactions = []
-        # for line in lines:
-        #     # Skip lines that don't match transaction pattern (date + description + amount)
-        #     if not line[0:5].replace('/', '').isdigit():
-        #         continue
-                
-        #     try:
-        #         # Extract date (first 5 chars: MM/DD)
-        #         date = line[0:5]
-                
-        #         # Amount is the last numeric value on the line
-        #         amount = None
-        #         words = line.split()
-        #         for word in reversed(words):
-        #             try:
-        #                 amount = float(word.replace(',', ''))
-        #                 break
-        #             except ValueError:
-        #                 continue
-                
-        #         if amount is None:
-        #             continue
-                    
-        #         # Description is everything between date and amount
-        #         desc_end = line.rfind(str(amount))
-        #         if desc_end == -1:
-        #             continue
-                    
-        #         description = line[5:desc_end].strip()
-                
-        #         transactions.append(Transaction(
-        #             date=datetime.strptime(date, "%m/%d"),
-        #             description=description,
-        #             amount=amount,
-        #             transaction_type=TransactionType.PURCHASE
-        #         ))
-                
-        #     except Exception:
-        #         logger.error(f"Failed to parse transaction line: {line}")
-        #         continue
-                
-        # return transactions
-
-        return all_purchases_text
\ No newline at end of file
+        return all_purchases_text